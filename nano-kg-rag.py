@@ -6,7 +6,7 @@ In case we run it in https://colab.research.google.com/
 # Install requirements
 !apt-get update
 !apt-get install -y sudo
-!pip install rdflib llama-index-llms-ollama
+!pip install rdflib oxrdflib llama-index-llms-ollama
 
 # Install Ollama
 !curl -fsSL https://ollama.com/install.sh | sh
@@ -17,12 +17,14 @@ In case we run it in https://colab.research.google.com/
 
 # Launch Ollama endpoint
 !ollama run llama3.1:8b > /dev/null 2>&1 &
+!ollama pull nomic-embed-text
 
 # To run it locally
 Install Ollama locally https://ollama.com/download
 ollama run llama3.1:8b
+ollama pull nomic-embed-text
 python3 -m venv venv && source venv/bin/activate
-python3 -m pip install llama-index-llms-ollama rdflib
+python3 -m pip install llama-index-llms-ollama rdflib oxrdflib
 
 # ---
 
@@ -41,13 +43,34 @@ Who is Katie's brother?
 
 # ---
 
+import asyncio
+import atexit
+import functools
+import hashlib
+import json
+import math
+import re
+from urllib.parse import quote
+
+import ollama
 import rdflib
+from rdflib.namespace import NamespaceManager
+from rdflib.plugins.sparql import prepareQuery
 from llama_index.llms.ollama import Ollama
 
 # Constants
 KNOW_ONTOLOGY_URL = "https://know.dev/"
+KNOW = rdflib.Namespace(KNOW_ONTOLOGY_URL)
 MODEL_NAME = 'llama3.1:8b'
-TURTLE_FILE = "knowledge_base.ttl"
+EMBED_MODEL_NAME = 'nomic-embed-text'
+CLASSIFICATION_LABELS = ("Capture Knowledge", "Retrieve Knowledge")
+CLASSIFY_MAX_TOKENS = 8
+CLASSIFY_CACHE_THRESHOLD = 0.92
+CLASSIFY_CACHE_SIZE = 256
+KB_FILE = "knowledge_base.nt"
+LEGACY_KB_FILE = "knowledge_base.ttl"
+KNOW_ONTOLOGY_CACHE = "know_ontology.ttl"
+KB_FLUSH_PENDING = 8  # captures
 
 QUERY_ONTOLOGY_SUBSET = '''
     PREFIX know: <https://know.dev/>
@@ -83,8 +106,34 @@ QUERY_ONTOLOGY_SUBSET = '''
     }
 '''
 
+# Only these predicates help the LLM pick classes and property names;
+# comments, provenance and OWL restrictions just add prompt tokens
+ONTOLOGY_PREDICATES = {
+    rdflib.RDF.type,
+    rdflib.RDFS.label,
+    rdflib.RDFS.domain,
+    rdflib.RDFS.range,
+    rdflib.RDFS.subClassOf,
+    rdflib.RDFS.subPropertyOf,
+    rdflib.OWL.inverseOf,
+}
+
+def _ontology_cache_key(url):
+    key = "\n".join([url, QUERY_ONTOLOGY_SUBSET, *sorted(ONTOLOGY_PREDICATES)])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
 # Load the RDF ontology file
-def load_ontology(url):
+def load_ontology(url, cache_file=KNOW_ONTOLOGY_CACHE):
+    # Reuse the subset from a previous run, the ontology is static
+    cache_header = f"# {_ontology_cache_key(url)}\n"
+    try:
+        with open(cache_file, encoding="utf-8") as f:
+            cached = f.read()
+        if cached.startswith(cache_header):
+            return cached[len(cache_header):]
+    except FileNotFoundError:
+        pass
+
     graph = rdflib.Graph()
     graph.parse(url)
 
@@ -93,48 +142,120 @@ def load_ontology(url):
 
     # Serialize the result into a new Turtle file
     subset_graph = rdflib.Graph()
-    subset_graph.bind("know", "https://know.dev/")
-    for triple in subset:
-        subset_graph.add(triple)
+    subset_graph.bind("know", KNOW)
+    for s, p, o in subset:
+        # Blank nodes would only point at restrictions that are not included
+        if p in ONTOLOGY_PREDICATES and not isinstance(o, rdflib.BNode):
+            subset_graph.add((s, p, o))
+
+    ontology = subset_graph.serialize(format="turtle")
+    with open(cache_file, "w", encoding="utf-8") as f:
+        f.write(cache_header + ontology)
+
+    return ontology
 
-    return subset_graph.serialize(format="turtle")
+def _local_name(term):
+    if term.startswith(KNOW):
+        return term[len(KNOW):]
+    return re.split(r"[#/]", term)[-1]
+
+def _names(terms):
+    return sorted({_local_name(term) for term in terms})
+
+@functools.lru_cache(maxsize=4)
+def render_ontology(ontology: str):
+    """
+    Render the ontology subset compactly for prompts: properties grouped by
+    domain and range, then the property hierarchy and inverses.
+    """
+    graph = rdflib.Graph()
+    graph.parse(data=ontology, format="turtle")
+
+    lines = [f"Namespace know: <{KNOW}>",
+             f"Classes: {', '.join(_names(graph.subjects(rdflib.RDF.type, rdflib.OWL.Class)))}"]
+    properties = set(graph.subjects(rdflib.RDFS.domain)) | set(graph.subjects(rdflib.RDFS.range))
+    by_signature = {}
+    for prop in properties:
+        domain = "/".join(_names(graph.objects(prop, rdflib.RDFS.domain))) or "Thing"
+        range_ = "/".join(_names(graph.objects(prop, rdflib.RDFS.range))) or "Thing"
+        by_signature.setdefault(f"{domain} -> {range_}", []).append(prop)
+    for signature, props in sorted(by_signature.items()):
+        lines.append(f"{signature}: {', '.join(_names(props))}")
+
+    children = {}
+    for prop, parent in graph.subject_objects(rdflib.RDFS.subPropertyOf):
+        children.setdefault(_local_name(parent), []).append(prop)
+    if children:
+        lines.append("Subproperties: " + "; ".join(
+            f"{parent} > {', '.join(_names(props))}" for parent, props in sorted(children.items())))
+
+    inverses = {tuple(sorted((_local_name(a), _local_name(b))))
+                for a, b in graph.subject_objects(rdflib.OWL.inverseOf)}
+    if inverses:
+        lines.append("Inverses: " + ", ".join(f"{a} / {b}" for a, b in sorted(inverses)))
+    return "\n".join(lines)
 
 # Load the KNOW ontology
 know_ontology = load_ontology(KNOW_ONTOLOGY_URL)
 
+# Reuse one Ollama client per model (and generation limit) across calls
+@functools.lru_cache(maxsize=4)
+def _get_llm(model: str, num_predict: int = None, json_mode: bool = False):
+    additional_kwargs = {"num_predict": num_predict} if num_predict else {}
+    return Ollama(model=model, request_timeout=360.0, json_mode=json_mode,
+                  additional_kwargs=additional_kwargs)
+
 # Query Ollama API
-def query_ollama(model: str, prompt: str):
-    llm = Ollama(model=model, request_timeout=360.0)
-    return llm.complete(prompt).text
+def query_ollama(model: str, prompt: str, json_mode: bool = False):
+    return _get_llm(model, json_mode=json_mode).complete(prompt).text
+
+async def aquery_ollama(model: str, prompt: str, json_mode: bool = False):
+    return (await _get_llm(model, json_mode=json_mode).acomplete(prompt)).text
+
+# Stream the response and stop as soon as it contains one of `stop_on`
+async def aquery_ollama_stream(model: str, prompt: str, stop_on=None, num_predict: int = None):
+    text = ""
+    stream = await _get_llm(model, num_predict).astream_complete(prompt)
+    async for response in stream:
+        text = response.text
+        if stop_on and any(stop in text for stop in stop_on):
+            break
+    # This only closes llama-index's wrapper, the HTTP stream underneath is
+    # released when it is garbage collected; num_predict bounds the generation
+    await stream.aclose()
+    return text
 
 # Prompt Templates
+# Keep everything static (instructions, ontology, examples) ahead of the user
+# input so Ollama can reuse the KV cache for the shared prompt prefix.
 PROMPT_TEMPLATE_CAPTURE = """
 You are a system designed to extract knowledge from user inputs and map it to the ontology provided.
 
 Ontology:
 {ontology}
 
-User Input: {user_input}
-
-Output the extracted knowledge as RDF triples in Turtle format.
+Output the extracted knowledge as RDF triples in JSON format.
 Capture only one knowledge at time.
-Please always use only `know` as prefix in output.
+Use ontology terms without prefix as "s", "p" and "o", use "type" as "p" for the class of an individual,
+and set "literal" to true when "o" is a plain value rather than an individual.
 
 For example:
 User input: Nathan loved to take his sister, Donna, with him whenever he went shopping.
 
 Your output:
-@prefix know: <https://know.dev/> .
-
-know:Nathan a know:Person ;
-    know:name "Nathan" ;
-    know:sister know:Donna .
-
-know:Donna a know:Person ;
-    know:name "Donna".
+{{"triples": [
+  {{"s": "Nathan", "p": "type", "o": "Person"}},
+  {{"s": "Nathan", "p": "name", "o": "Nathan", "literal": true}},
+  {{"s": "Nathan", "p": "sister", "o": "Donna"}},
+  {{"s": "Donna", "p": "type", "o": "Person"}},
+  {{"s": "Donna", "p": "name", "o": "Donna", "literal": true}}
+]}}
 
 Ensure the format adheres to the ontology structure.
-Please output only RDF triples, no other text, note or explanation.
+Please output only JSON, no other text, note or explanation.
+
+User Input: {user_input}
+Your output:
 """
 
 PROMPT_TEMPLATE_CLASSIFY = """
@@ -163,30 +284,205 @@ User Input: {user_input}
 Classification:
 """
 
-def classify_input(user_input, ontology, model=MODEL_NAME):
-    formatted_prompt = PROMPT_TEMPLATE_CLASSIFY.format(ontology=ontology, user_input=user_input)
-    classification = query_ollama(model, formatted_prompt)
+_USER_INPUT_MARKER = "\x00user_input\x00"
+
+# Format a template with the rendered ontology once and split it around the user input
+@functools.lru_cache(maxsize=8)
+def _prompt_parts(template: str, ontology: str):
+    formatted = template.format(ontology=render_ontology(ontology), user_input=_USER_INPUT_MARKER)
+    prefix, _, suffix = formatted.partition(_USER_INPUT_MARKER)
+    return prefix, suffix
+
+def build_prompt(template: str, ontology: str, user_input: str):
+    prefix, suffix = _prompt_parts(template, ontology)
+    return prefix + user_input + suffix
+
+# Classification cache: exact matches on the normalized input, then
+# embeddings of earlier inputs compared by cosine similarity
+_classify_exact = {}
+_classify_semantic = []
+
+def embed(text: str, model: str = EMBED_MODEL_NAME):
+    try:
+        return ollama.embeddings(model=model, prompt=text)["embedding"]
+    except ollama.ResponseError:
+        # The embedding model is optional, e.g. not pulled yet
+        return None
+
+def _cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+def _lookup_similar_classification(embedding):
+    best_label, best_score = None, CLASSIFY_CACHE_THRESHOLD
+    for cached_embedding, label in _classify_semantic:
+        score = _cosine_similarity(embedding, cached_embedding)
+        if score >= best_score:
+            best_label, best_score = label, score
+    return best_label
+
+RETRIEVE_PATTERN = re.compile(r'^\s*(who|what|which|where|when|is|are|does|do)\b', re.IGNORECASE)
+CAPTURE_PATTERN = re.compile(r'^\s*(please\s+)?remember\b', re.IGNORECASE)
+
+# Route the obvious questions and statements without asking the LLM
+def _cheap_classify(user_input: str):
+    text = user_input.strip()
+    if RETRIEVE_PATTERN.match(text) or text.endswith('?'):
+        return "Retrieve Knowledge"
+    if CAPTURE_PATTERN.match(text) or text.endswith('.'):
+        return "Capture Knowledge"
+    return None
+
+async def classify_input(user_input, ontology, model=MODEL_NAME):
+    classification = _cheap_classify(user_input)
+    if classification:
+        return classification
+
+    key = user_input.lower().strip()
+    if key in _classify_exact:
+        return _classify_exact[key]
+
+    embedding = await asyncio.to_thread(embed, user_input)
+    classification = _lookup_similar_classification(embedding) if embedding else None
+    if classification is None:
+        formatted_prompt = build_prompt(PROMPT_TEMPLATE_CLASSIFY, ontology, user_input)
+        classification = await aquery_ollama_stream(model, formatted_prompt,
+                                                    stop_on=CLASSIFICATION_LABELS,
+                                                    num_predict=CLASSIFY_MAX_TOKENS)
+
+    # Only remember answers the main loop can act on
+    if any(label in classification for label in CLASSIFICATION_LABELS):
+        if len(_classify_exact) >= CLASSIFY_CACHE_SIZE:
+            _classify_exact.pop(next(iter(_classify_exact)))
+        _classify_exact[key] = classification
+        if embedding:
+            if len(_classify_semantic) >= CLASSIFY_CACHE_SIZE:
+                _classify_semantic.pop(0)
+            _classify_semantic.append((embedding, classification))
     return classification
 
-def capture_knowledge(user_input, ontology, model=MODEL_NAME):
-    formatted_prompt = PROMPT_TEMPLATE_CAPTURE.format(ontology=ontology, user_input=user_input)
-    rdf_output = query_ollama(model, formatted_prompt)
-    return rdf_output
+def _know_term(name: str):
+    # Percent-encode characters like quotes or angle brackets that are not valid in an IRI
+    return KNOW[quote(name.strip().replace(" ", "_"), safe="")]
 
-def store_knowledge(rdf_triples, turtle_file=TURTLE_FILE):
-    graph1 = rdflib.Graph()
+def _know_local_name(value):
+    """
+    Return the local name of a know: term given as "Nathan", "know:Nathan" or a
+    full URI, or None if the value is not a usable name.
+    """
+    if not isinstance(value, str):
+        return None
+    name = value.strip()
+    for prefix in (str(KNOW), "know:", ":"):
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+            break
+    return name or None
+
+RDF_TYPE_NAMES = {"a", "type", "rdf:type", str(rdflib.RDF.type)}
+
+def capture_knowledge(user_input, ontology, model=MODEL_NAME):
+    """
+    Extract knowledge from the user's input as an RDF graph, using JSON mode so
+    the LLM output never has to go through the Turtle parser.
+    Returns None when the output cannot be read as triples.
+    """
+    formatted_prompt = build_prompt(PROMPT_TEMPLATE_CAPTURE, ontology, user_input)
     try:
-        # Load existing triples if the file exists
-        graph1.parse(turtle_file, format="turtle")
-    except FileNotFoundError:
-        pass
-    # Add new triples
-    graph2 = rdflib.Graph()
-    graph2.parse(data=rdf_triples, format="turtle")
+        json_output = json.loads(query_ollama(model, formatted_prompt, json_mode=True))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(json_output, dict) or not isinstance(json_output.get("triples"), list):
+        return None
 
-    graph = graph1 + graph2
-    # Save updated graph back to file
-    graph.serialize(turtle_file, format="turtle")
+    properties = ontology_properties(ontology)
+    graph = rdflib.Graph()
+    graph.bind("know", KNOW)
+    for triple in json_output["triples"]:
+        if not isinstance(triple, dict):
+            continue
+        subject = _know_local_name(triple.get("s"))
+        if subject is None or not isinstance(triple.get("p"), str):
+            continue
+
+        if triple["p"].strip() in RDF_TYPE_NAMES:
+            predicate = rdflib.RDF.type
+        else:
+            predicate = _know_local_name(triple["p"])
+            # Only properties defined in the ontology can be stored
+            if predicate not in properties:
+                continue
+            predicate = _know_term(predicate)
+
+        value = triple.get("o")
+        if not isinstance(value, (str, int, float)):
+            continue
+        if triple.get("literal") is True or not isinstance(value, str):
+            obj = rdflib.Literal(value)
+        else:
+            obj = _know_local_name(value)
+            if obj is None:
+                continue
+            obj = _know_term(obj)
+        graph.add((_know_term(subject), predicate, obj))
+    return graph if len(graph) else None
+
+# In-memory knowledge base, parsed from disk once and kept in sync on store
+# Oxigraph keeps SPO/POS/OSP indexes and evaluates SPARQL natively
+try:
+    import oxrdflib  # noqa: F401
+    KB_STORE = "Oxigraph"
+except ImportError:
+    KB_STORE = "default"
+KB_GRAPH = rdflib.Graph(store=KB_STORE)
+KB_GRAPH.namespace_manager.bind("know", KNOW)
+_kb_loaded = False
+
+def load_knowledge_base():
+    global _kb_loaded
+    if not _kb_loaded:
+        try:
+            # Load existing triples if the file exists
+            KB_GRAPH.parse(KB_FILE, format="nt")
+        except FileNotFoundError:
+            # Migrate a knowledge base from before the switch to N-Triples once
+            try:
+                legacy_graph = rdflib.Graph()
+                legacy_graph.parse(LEGACY_KB_FILE, format="turtle")
+            except FileNotFoundError:
+                pass
+            else:
+                KB_GRAPH.addN((s, p, o, KB_GRAPH) for s, p, o in legacy_graph)
+                legacy_graph.serialize(KB_FILE, format="nt", encoding="utf-8")
+                print(f"Migrated {LEGACY_KB_FILE} to {KB_FILE}.")
+        _kb_loaded = True
+    return KB_GRAPH
+
+# Captured triples not yet appended to disk
+_pending_writes = []
+
+def flush_knowledge_base():
+    if _pending_writes:
+        with open(KB_FILE, "a", encoding="utf-8") as f:
+            f.write("".join(_pending_writes))
+        _pending_writes.clear()
+
+atexit.register(flush_knowledge_base)
+
+def store_knowledge(new_graph):
+    graph = load_knowledge_base()
+    # Only triples not yet in the knowledge base are added and written
+    new_triples = new_graph - graph
+    # Add new triples in place, in one batch
+    graph += new_triples
+
+    # N-Triples is line based, so only the new triples need to be written;
+    # they are batched until the next retrieve, exit or KB_FLUSH_PENDING captures
+    if len(new_triples):
+        _pending_writes.append(new_triples.serialize(format="nt"))
+    if len(_pending_writes) >= KB_FLUSH_PENDING:
+        flush_knowledge_base()
     print("Knowledge stored successfully!")
 
 
@@ -204,6 +500,7 @@ Requirements:
 3. Ensure the query retrieves the correct `?subject`, `?predicate`, and `?object` based on the user's input.
 4. Do not provide any additional text except SPARQL query.
 5. Never use backticks.
+6. Bind known terms with VALUES before the `?s ?p ?o` triple pattern, never compare them in a FILTER.
 
 Examples:
 User Input: "Who is Johnny's sister?"
@@ -211,62 +508,147 @@ User Input: "Who is Johnny's sister?"
 SPARQL Query:
 
 PREFIX : <https://know.dev/>
-SELECT *
+SELECT ?s ?p ?o
 WHERE {{
-  ?s a :Person ;
-     ?p ?o .
-    FILTER (?s = :Johnny && ?p = :sister)
+  VALUES (?s ?p) {{ (:Johnny :sister) }}
+  ?s ?p ?o .
+}}
+
+User Input: "Whose sister is Donna?"
+
+SPARQL Query:
+
+PREFIX : <https://know.dev/>
+SELECT ?s ?p ?o
+WHERE {{
+  VALUES (?p ?o) {{ (:sister :Donna) }}
+  ?s ?p ?o .
 }}
 
 User Input: "{user_input}"
 SPARQL Query:
 """
 
-def generate_sparql_query(user_input, ontology, model=MODEL_NAME):
+# Matches only "Who is Katie's brother?" and "What is the name of Katie's brother?",
+# anything else (e.g. "Who is the wife of Katie's brother?") goes to the LLM
+RELATION_QUESTION_PATTERN = re.compile(
+    r"^\s*(?:who is|what is the name of)\s+(\w+)['’]s\s+(\w+)\s*\??\s*$", re.IGNORECASE)
+
+@functools.lru_cache(maxsize=4)
+def ontology_properties(ontology: str):
+    """
+    Return the local names of the properties defined on Person in the ontology.
+    """
+    graph = rdflib.Graph()
+    graph.parse(data=ontology, format="turtle")
+    properties = set(graph.subjects(rdflib.RDFS.domain)) | set(graph.subjects(rdflib.RDFS.range))
+    return frozenset(
+        prop[len(KNOW):] for prop in properties if prop.startswith(KNOW)
+    )
+
+def match_relation_question(user_input, ontology):
+    """
+    Return the (subject, predicate) local names of a simple "X's <relation>" question.
+    Returns None when the input does not match or the relation is unknown.
+    """
+    match = RELATION_QUESTION_PATTERN.match(user_input)
+    if not match:
+        return None
+    subject, predicate = match.group(1), match.group(2).lower()
+    if predicate not in ontology_properties(ontology):
+        return None
+    return subject[:1].upper() + subject[1:], predicate
+
+async def generate_sparql_query(user_input, ontology, model=MODEL_NAME):
     """
     Generate a SPARQL query using the LLM based on the user's input and the ontology.
     """
-    prompt = PROMPT_TEMPLATE_SPARQL.format(user_input=user_input, ontology=ontology)
-    sparql_query = query_ollama(model, prompt).strip()
+    prompt = build_prompt(PROMPT_TEMPLATE_SPARQL, ontology, user_input)
+    sparql_query = (await aquery_ollama(model, prompt)).strip()
     print(f'Generated SPARQL Query:\n{sparql_query}')
 
     try:
         # Test parsing the query with rdflib
-        rdflib.plugins.sparql.processor.prepareQuery(sparql_query)
+        prepare_sparql_query(sparql_query)
     except Exception as e:
         raise e
 
     return sparql_query
 
 
-def retrieve_knowledge(user_input, ontology, turtle_file=TURTLE_FILE, model=MODEL_NAME):
+# Parse and compile each distinct query only once
+@functools.lru_cache(maxsize=64)
+def prepare_sparql_query(sparql_query: str):
+    return prepareQuery(sparql_query)
+
+
+async def retrieve_knowledge(user_input, ontology, model=MODEL_NAME, sparql_task=None):
     """
-    Retrieve knowledge by generating a SPARQL query using LLM and executing it on the Turtle file.
+    Retrieve knowledge by generating a SPARQL query using LLM and executing it on the knowledge base.
+    `sparql_task` is an already started generate_sparql_query task to reuse.
     """
-    graph = rdflib.Graph()
-    graph.parse(turtle_file, format="turtle")
+    graph = load_knowledge_base()
+    flush_knowledge_base()
+
+    # Simple "X's <relation>" questions are a single indexed triple lookup
+    relation = match_relation_question(user_input, ontology)
+    if relation is not None:
+        subject, predicate = relation
+        return format_results(graph.triples((_know_term(subject), _know_term(predicate), None)))
     
     # Generate SPARQL query using LLM
-    sparql_query = generate_sparql_query(user_input, ontology, model=model)
+    if sparql_task is None:
+        sparql_task = generate_sparql_query(user_input, ontology, model=model)
+    sparql_query = await sparql_task
     
     # Execute the SPARQL query
     try:
-        results = graph.query(sparql_query)
-        results_graph = rdflib.Graph()
-        results_graph.bind("know", "https://know.dev/")
-        for triple in results:
-            if triple:
-                # return first result.
-                results_graph.add(triple)
-                return results_graph.serialize(format="turtle")
-            else:
-                return "No relevant knowledge found."
+        # Oxigraph runs its own SPARQL engine on the query string, the
+        # rdflib engine reuses the query prepared during validation
+        if KB_STORE == "Oxigraph":
+            results = graph.query(sparql_query)
+        else:
+            results = graph.query(prepare_sparql_query(sparql_query))
+        return format_results(results)
 
     except Exception as e:
         return f"Error executing SPARQL query: {e}"
 
 
-if __name__ == "__main__":
+# Only know: is declared in the output, so no other prefix may be used
+RESULTS_NAMESPACES = NamespaceManager(rdflib.Graph(), bind_namespaces="none")
+RESULTS_NAMESPACES.bind("know", KNOW)
+
+def _is_triple(row):
+    return (len(row) == 3 and isinstance(row[0], (rdflib.URIRef, rdflib.BNode))
+            and isinstance(row[1], rdflib.URIRef) and row[2] is not None)
+
+def _plain_value(term):
+    if term is None:
+        return "unbound"
+    if isinstance(term, rdflib.Literal):
+        return str(term)
+    if isinstance(term, rdflib.term.Node):
+        return term.n3(RESULTS_NAMESPACES)
+    return str(term)
+
+def format_results(results):
+    """
+    Format the results as Turtle when every row is a triple, writing the terms
+    directly instead of going through a graph and its serializer. Other rows,
+    e.g. from SELECT ?o or with unbound OPTIONAL columns, are listed as plain values.
+    """
+    # ASK queries iterate as a single boolean instead of rows
+    rows = [row if isinstance(row, tuple) else (row,) for row in results]
+    if not rows:
+        return "No relevant knowledge found."
+    if all(_is_triple(row) for row in rows):
+        lines = [" ".join(term.n3(RESULTS_NAMESPACES) for term in row) + " .\n" for row in rows]
+        return f"@prefix know: <{KNOW}> .\n\n" + "".join(lines)
+    return "\n".join(", ".join(_plain_value(term) for term in row) for row in rows)
+
+
+async def main():
     print("Welcome to the Ontology-Guided Knowledge Capture System using Ollama!")
     print("Type 'exit' to quit.")
     
@@ -274,18 +656,39 @@ if __name__ == "__main__":
         user_input = input("\nEnter your input: ")
         if user_input.lower() == "exit":
             break
+
+        # When the LLM has to classify the input and the question is not a
+        # simple lookup, generate the SPARQL query speculatively meanwhile
+        sparql_task = None
+        if (_cheap_classify(user_input) is None
+                and match_relation_question(user_input, know_ontology) is None):
+            sparql_task = asyncio.create_task(
+                generate_sparql_query(user_input, know_ontology, model=MODEL_NAME))
         
-        classification = classify_input(user_input, know_ontology, model=MODEL_NAME)
+        classification = await classify_input(user_input, know_ontology, model=MODEL_NAME)
         print(f"Classification: {classification}")
 
+        if 'Retrieve Knowledge' not in classification and sparql_task is not None:
+            sparql_task.cancel()
+            # Wait for the cancellation to close the request before anything
+            # blocking runs, and discard any error raised while generating
+            await asyncio.gather(sparql_task, return_exceptions=True)
+
         if 'Capture Knowledge' in classification:
             rdf_triples = capture_knowledge(user_input, know_ontology, model=MODEL_NAME)
+            if rdf_triples is None:
+                print("\nCould not extract knowledge from the input. Please try again.")
+                continue
             print("\nExtracted Knowledge (in Turtle format):\n")
-            print(rdf_triples)
-            store_knowledge(rdf_triples, turtle_file=TURTLE_FILE)
+            print(rdf_triples.serialize(format="turtle"))
+            store_knowledge(rdf_triples)
         elif 'Retrieve Knowledge' in classification:
-            response = retrieve_knowledge(user_input, know_ontology, turtle_file=TURTLE_FILE)
+            response = await retrieve_knowledge(user_input, know_ontology, sparql_task=sparql_task)
             print("\nRetrieved Knowledge:\n")
             print(response)
         else:
             print("\nCould not classify the input. Please try again.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())